@@ -1,149 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
-from garminconnect import Garmin
 from notion_client import Client
 from dotenv import load_dotenv
+from pathlib import Path
+import hashlib
+import json
 import os
+import sqlite3
 
-# notion_helpers.py
-from typing import Optional, Dict, Tuple
-from notion_client import Client, APIResponseError
+from garmin_auth import login_garmin
+from http_session import get_notion_http_client
 
-# Simple in-process cache
-_DS_CACHE: Dict[str, Tuple[str, str]] = {}
+# Local record of what was last written to each page, so unchanged days skip pages.update
+HASH_CACHE_PATH = Path.home() / ".cache" / "garmin-to-notion" / "hashes.sqlite"
+# Concurrent Notion writes; Notion allows ~3 requests/s per integration
+MAX_NOTION_WORKERS = 3
 
-def get_data_source_id(
-    client: Client,
-    database_id: str,
-    prefer_name: Optional[str] = None
-) -> str:
-    """
-    Resolve the data_source_id for a given Notion database (container).
-    Optionally pick a data source by name. Caches the result.
-    """
-    cached = _DS_CACHE.get(database_id)
-    if cached and (prefer_name is None or cached[1] == prefer_name):
-        return cached[0]
+# Constant title property shared by every daily steps entry (never mutated)
+WALKING_TITLE = {"title": [{"text": {"content": "Walking"}}]}
 
-    try:
-        # In Notion 2025-09-03, databases.retrieve returns a container
-        # object that includes a 'data_sources' array (id + name).
-        db = client.databases.retrieve(database_id=database_id)
-    except APIResponseError as e:
-        raise RuntimeError(
-            "Could not retrieve the database container from Notion. "
-            "Check that the ID is a *database* ID (from the DB page URL), "
-            "not a page/view/link ID, and that the database is shared with your integration."
-        ) from e
-
-    data_sources = db.get("data_sources") or []
-    if not data_sources:
-        raise RuntimeError(
-            "No data sources found (or no permission). Make sure this is the ORIGINAL database "
-            "(not a linked view) and that your integration is added via ⋯ → Connections."
-        )
-
-    chosen = None
-    if prefer_name:
-        for ds in data_sources:
-            if ds.get("name") == prefer_name:
-                chosen = ds
-                break
-        if not chosen:
-            names = ", ".join(ds.get("name", "〈unnamed〉") for ds in data_sources)
-            raise RuntimeError(f"Data source named '{prefer_name}' not found. Available: {names}")
-    else:
-        chosen = data_sources[0]
-
-    ds_id = chosen["id"]
-    _DS_CACHE[database_id] = (ds_id, chosen.get("name", ""))
-    return ds_id
-
-def get_all_daily_steps(garmin):
+def get_all_daily_steps(garmin, days=1):
     """
     Get last x days of daily step count data from Garmin Connect.
     """
-    startdate = date.today() - timedelta(days=1)
-    daterange = [startdate + timedelta(days=x) 
-                 for x in range((date.today() - startdate).days)] # excl. today
-    daily_steps = []
-    for d in daterange:
-        daily_steps += garmin.get_daily_steps(d.isoformat(), d.isoformat())
-    return daily_steps
+    startdate = date.today() - timedelta(days=max(days, 1))
+    enddate = date.today() - timedelta(days=1) # excl. today
+    # get_daily_steps accepts a date range, so fetch it in one call
+    return garmin.get_daily_steps(startdate.isoformat(), enddate.isoformat()) or []
 
-def daily_steps_exist(client, database_id, activity_date):
+def get_existing_daily_steps(client, database_id, start_date, end_date):
     """
-    Check if daily step count already exists in the Notion database.
+    Fetch all daily step entries between start_date and end_date (inclusive)
+    from the Notion database in one paginated query, indexed by date.
     """
-    query = client.databases.query(
-        database_id=database_id,
-        filter={
+    existing = {}
+    query_args = {
+        "database_id": database_id,
+        "filter": {
             "and": [
-                {"property": "Date", "date": {"equals": activity_date}},
+                {"property": "Date", "date": {"on_or_after": start_date}},
+                {"property": "Date", "date": {"on_or_before": end_date}},
                 {"property": "Activity Type", "title": {"equals": "Walking"}}
             ]
-        }
+        },
+        "page_size": 100,
+    }
+    while True:
+        query = client.databases.query(**query_args)
+        for page in query['results']:
+            page_date = (page['properties']['Date'].get('date') or {}).get('start')
+            if page_date:
+                existing.setdefault(page_date[:10], page)
+        if not query.get('has_more'):
+            break
+        query_args["start_cursor"] = query['next_cursor']
+    return existing
+
+def daily_steps_properties(steps):
+    """
+    Build the Notion properties written for a daily steps entry (excluding Date).
+    """
+    total_distance = steps.get('totalDistance')
+    if total_distance is None:
+        total_distance = 0
+    return {
+        "Activity Type": WALKING_TITLE,
+        "Total Steps": {"number": steps.get('totalSteps')},
+        "Step Goal": {"number": steps.get('stepGoal')},
+        "Total Distance (km)": {"number": round(total_distance / 1000, 2)}
+    }
+
+def properties_hash(properties):
+    """
+    Stable short digest of a properties dict.
+    """
+    payload = json.dumps(properties, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+def open_hash_cache(path=HASH_CACHE_PATH):
+    """
+    Open (and create if needed) the local sqlite cache of written property hashes.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS page_hashes ("
+        "database_id TEXT NOT NULL, page_id TEXT NOT NULL, digest TEXT NOT NULL, "
+        "PRIMARY KEY (database_id, page_id))"
     )
-    results = query['results']
-    return results[0] if results else None
+    return conn
+
+def get_cached_hash(conn, database_id, page_id):
+    row = conn.execute(
+        "SELECT digest FROM page_hashes WHERE database_id = ? AND page_id = ?",
+        (database_id, page_id),
+    ).fetchone()
+    return row[0] if row else None
+
+def set_cached_hash(conn, database_id, page_id, digest):
+    conn.execute(
+        "INSERT OR REPLACE INTO page_hashes (database_id, page_id, digest) VALUES (?, ?, ?)",
+        (database_id, page_id, digest),
+    )
+    conn.commit()
 
 def steps_need_update(existing_steps, new_steps):
     """
     Compare existing steps data with imported data to determine if an update is needed.
     """
     existing_props = existing_steps['properties']
-    activity_type = "Walking"
+    new_props = daily_steps_properties(new_steps)
+    existing_title = "".join(
+        t.get('plain_text') or t.get('text', {}).get('content', '')
+        for t in existing_props['Activity Type']['title']
+    )
     
     return (
-        existing_props['Total Steps']['number'] != new_steps.get('totalSteps') or
-        existing_props['Step Goal']['number'] != new_steps.get('stepGoal') or
-        existing_props['Total Distance (km)']['number'] != new_steps.get('totalDistance') or
-        existing_props['Activity Type']['title'] != activity_type
+        existing_props['Total Steps']['number'] != new_props['Total Steps']['number'] or
+        existing_props['Step Goal']['number'] != new_props['Step Goal']['number'] or
+        existing_props['Total Distance (km)']['number'] != new_props['Total Distance (km)']['number'] or
+        existing_title != "Walking"
     )
 
 def update_daily_steps(client, existing_steps, new_steps):
     """
     Update an existing daily steps entry in the Notion database with new data.
     """
-    total_distance = new_steps.get('totalDistance')
-    if total_distance is None:
-        total_distance = 0
-    properties = {
-        "Activity Type":  {"title": [{"text": {"content": "Walking"}}]},
-        "Total Steps": {"number": new_steps.get('totalSteps')},
-        "Step Goal": {"number": new_steps.get('stepGoal')},
-        "Total Distance (km)": {"number": round(total_distance / 1000, 2)}
-    }
-    
     update = {
         "page_id": existing_steps['id'],
-        "properties": properties,
+        "properties": daily_steps_properties(new_steps),
     }
         
-    client.pages.update(**update)
+    return client.pages.update(**update)
 
 def create_daily_steps(client, database_id, steps):
     """
     Create a new daily steps entry in the Notion database.
     """
-    total_distance = steps.get('totalDistance')
-    if total_distance is None:
-        total_distance = 0
-    properties = {
-        "Activity Type": {"title": [{"text": {"content": "Walking"}}]},
-        "Date": {"date": {"start": steps.get('calendarDate')}},
-        "Total Steps": {"number": steps.get('totalSteps')},
-        "Step Goal": {"number": steps.get('stepGoal')},
-        "Total Distance (km)": {"number": round(total_distance / 1000, 2)}
-    }
+    properties = daily_steps_properties(steps)
+    properties["Date"] = {"date": {"start": steps.get('calendarDate')}}
     
     page = {
         "parent": {"database_id": database_id},
         "properties": properties,
     }
     
-    client.pages.create(**page)
+    return client.pages.create(**page)
+
+def upsert_daily_steps(client, database_id, existing_steps, steps):
+    """
+    Update the existing entry if it differs, otherwise create one. Returns the page id.
+    """
+    if existing_steps is None:
+        return create_daily_steps(client, database_id, steps)['id']
+    if steps_need_update(existing_steps, steps):
+        update_daily_steps(client, existing_steps, steps)
+    return existing_steps['id']
 
-def main():
+def main(garmin=None):
     load_dotenv()
 
     # Initialize Garmin and Notion clients using environment variables
@@ -152,20 +166,40 @@ def main():
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_STEPS_DB_ID")
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
-
-    daily_steps = get_all_daily_steps(garmin)
-    for steps in daily_steps:
-        steps_date = steps.get('calendarDate')
-        existing_steps = daily_steps_exist(client, database_id, steps_date)
-        if existing_steps:
-            if steps_need_update(existing_steps, steps):
-                update_daily_steps(client, existing_steps, steps)
-        else:
-            create_daily_steps(client, database_id, steps)
+    # Initialize Garmin client and login (unless sync_all.py passes a logged-in one)
+    if garmin is None:
+        garmin = login_garmin(garmin_email, garmin_password)
+    client = Client(auth=notion_token, client=get_notion_http_client())
+
+    # Days back (ending yesterday) to sync; raise STEPS_SYNC_DAYS to backfill missed days
+    daily_steps = get_all_daily_steps(garmin, int(os.getenv("STEPS_SYNC_DAYS", "1")))
+    if not daily_steps:
+        return
+
+    # One ranged query instead of one lookup per day
+    step_dates = [steps.get('calendarDate') for steps in daily_steps]
+    existing = get_existing_daily_steps(client, database_id, min(step_dates), max(step_dates))
+
+    hash_cache = open_hash_cache()
+    try:
+        pending = []
+        for steps in daily_steps:
+            existing_steps = existing.get(steps.get('calendarDate'))
+            digest = properties_hash(daily_steps_properties(steps))
+            if existing_steps and get_cached_hash(hash_cache, database_id, existing_steps['id']) == digest:
+                continue
+            pending.append((existing_steps, steps, digest))
+
+        # Overlap the per-day writes; the sqlite cache stays on this thread
+        with ThreadPoolExecutor(max_workers=MAX_NOTION_WORKERS) as executor:
+            futures = [
+                (executor.submit(upsert_daily_steps, client, database_id, existing_steps, steps), digest)
+                for existing_steps, steps, digest in pending
+            ]
+            for future, digest in futures:
+                set_cached_hash(hash_cache, database_id, future.result(), digest)
+    finally:
+        hash_cache.close()
 
 if __name__ == '__main__':
     main()
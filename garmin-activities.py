@@ -2,24 +2,27 @@
 import os
 from notion_client import Client
 from datetime import datetime, timezone
-from garminconnect import Garmin
 from notion_client import Client
 from dotenv import load_dotenv
 import pytz
 import os
+
+from garmin_auth import login_garmin
+from http_session import get_notion_http_client
 # Use the current Notion API version header (future-proof)
 NOTION_VERSION = os.environ.get("Notion-Version", "2025-09-03")
 
 # Build the Notion client once and reuse
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN")
-notion = Client(auth=NOTION_TOKEN, notion_version=NOTION_VERSION)
+notion = Client(auth=NOTION_TOKEN, notion_version=NOTION_VERSION, client=get_notion_http_client())
 
 # notion_helpers.py
 from typing import Optional, Dict, Tuple
 from notion_client import Client, APIResponseError
 
-# Simple in-process cache
-_DS_CACHE: Dict[str, Tuple[str, str]] = {}
+# Simple in-process cache keyed by (database_id, data source name);
+# (database_id, None) holds the default (first) data source.
+_DS_CACHE: Dict[Tuple[str, Optional[str]], str] = {}
 
 def get_data_source_id(
     client: Client,
@@ -30,9 +33,9 @@ def get_data_source_id(
     Resolve the data_source_id for a given Notion database (container).
     Optionally pick a data source by name. Caches the result.
     """
-    cached = _DS_CACHE.get(database_id)
-    if cached and (prefer_name is None or cached[1] == prefer_name):
-        return cached[0]
+    cached = _DS_CACHE.get((database_id, prefer_name))
+    if cached:
+        return cached
 
     try:
         # In Notion 2025-09-03, databases.retrieve returns a container
@@ -52,6 +55,12 @@ def get_data_source_id(
             "(not a linked view) and that your integration is added via ⋯ → Connections."
         )
 
+    # Index every data source of this container so other names don't refetch
+    _DS_CACHE.setdefault((database_id, None), data_sources[0]["id"])
+    for ds in data_sources:
+        if ds.get("name"):
+            _DS_CACHE.setdefault((database_id, ds["name"]), ds["id"])
+
     chosen = None
     if prefer_name:
         for ds in data_sources:
@@ -64,9 +73,7 @@ def get_data_source_id(
     else:
         chosen = data_sources[0]
 
-    ds_id = chosen["id"]
-    _DS_CACHE[database_id] = (ds_id, chosen.get("name", ""))
-    return ds_id
+    return chosen["id"]
 
 def print_schema(client: Client, database_id: str):
     """
@@ -84,27 +91,6 @@ def print_schema(client: Client, database_id: str):
     for name, meta in schema.get("properties", {}).items():
         print(f"  - {name} (type={meta.get('type')})")
 
-def get_data_source_id(notion: Client, database_id: str) -> str:
-    """
-    Return the first data source ID for the given Notion database.
-
-    With Notion-Version '2025-09-03', querying a database uses data_sources.query.
-    We first retrieve the database and read its data_sources array.
-
-    Raises:
-        RuntimeError: if no data source is found or the DB is not shared with the integration.
-    """
-    db = notion.databases.retrieve(database_id)
-    sources = db.get("data_sources", [])
-    if not sources:
-        raise RuntimeError(
-            f"No data_source found for database {database_id}. "
-            "Open the DB in Notion and ensure your integration is connected (Share → Add connections)."
-        )
-    return sources[0]["id"]
-
-
-
 # Your local time zone, replace with the appropriate one if needed
 local_tz = pytz.timezone('Europe/London')
 
@@ -393,7 +379,7 @@ def update_activity(client, existing_activity, new_activity):
         
     client.pages.update(**update)
 
-def main():
+def main(garmin=None):
     load_dotenv()
 
     # Initialize Garmin and Notion clients using environment variables
@@ -402,10 +388,10 @@ def main():
     notion_token = os.getenv("NOTION_TOKEN")
     database_id = os.getenv("NOTION_DB_ID")
 
-    # Initialize Garmin client and login
-    garmin = Garmin(garmin_email, garmin_password)
-    garmin.login()
-    client = Client(auth=notion_token)
+    # Initialize Garmin client and login (unless sync_all.py passes a logged-in one)
+    if garmin is None:
+        garmin = login_garmin(garmin_email, garmin_password)
+    client = Client(auth=notion_token, client=get_notion_http_client())
     
     # Get all activities
     activities = get_all_activities(garmin)
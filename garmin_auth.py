@@ -0,0 +1,20 @@
+# garmin_auth.py
+# Garmin login that reuses saved OAuth tokens instead of doing a full
+# credential login on every run (written against garminconnect 0.3.x).
+import os
+
+from garminconnect import Garmin
+
+# A token directory, or the JSON token string itself (garminconnect treats values
+# longer than 512 chars as token data rather than a path)
+GARMIN_TOKENSTORE = os.environ.get("GARMINTOKENS") or "~/.garminconnect"
+
+def login_garmin(email: str | None, password: str | None, tokenstore: str = GARMIN_TOKENSTORE) -> Garmin:
+    """
+    Log in from saved tokens when possible. Garmin.login(tokenstore) loads and refreshes
+    the tokens itself, falls back to credentials only when they are missing or invalid,
+    and writes fresh tokens back when tokenstore is a path.
+    """
+    garmin = Garmin(email, password)
+    garmin.login(tokenstore)
+    return garmin
@@ -0,0 +1,44 @@
+# http_session.py
+# Shared keep-alive HTTP clients so consecutive Notion calls reuse one
+# TCP+TLS connection instead of opening a new one per request.
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = 32
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+_SESSION: requests.Session | None = None
+# One connection pool for every Notion client. Each notion_client.Client writes its own
+# base_url/auth/version headers onto the httpx.Client it gets, so the pool (transport)
+# is shared but the httpx.Client is not.
+_NOTION_TRANSPORT = httpx.HTTPTransport(
+    retries=3,
+    limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+)
+
+def get_session() -> requests.Session:
+    """Process-wide requests.Session with a pooled, retrying HTTPS adapter."""
+    global _SESSION
+    if _SESSION is None:
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=RETRY_STATUSES,
+            # Idempotent methods only (plus PATCH: a page update re-applies the same properties).
+            # POST /v1/pages is never retried; a 5xx can arrive after the page was created.
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"PATCH"},
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        _SESSION = requests.Session()
+        _SESSION.mount("https://", adapter)
+    return _SESSION
+
+def get_notion_http_client() -> httpx.Client:
+    """
+    New httpx.Client on the shared Notion connection pool, for notion_client.Client
+    (the SDK is built on httpx, not requests). Call once per Notion client:
+    Client(auth=..., client=get_notion_http_client()).
+    """
+    return httpx.Client(transport=_NOTION_TRANSPORT)
@@ -3,13 +3,19 @@
 # - Optionally auto-creates standard sleep properties (set CREATE_MISSING_SLEEP_PROPERTIES=true)
 # - Skips properties that do not exist in your DB (prevents Notion 400 errors)
 
+import json
 import os
 import sys
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
-from garminconnect import Garmin
-from notion_client import Client
+from notion_client import Client, APIResponseError
+
+from garmin_auth import login_garmin
+from http_session import get_notion_http_client
 
 # ---------- Env & basic guards ----------
 NOTION_TOKEN = os.environ.get("NOTION_TOKEN")
@@ -19,88 +25,64 @@ TZ = ZoneInfo(os.environ.get("TZ", "Europe/London"))
 NOTION_VERSION = os.environ.get("Notion-Version", "2025-09-03")
 # Set to 'true' to let the script add standard properties to your Sleep DB if they are missing
 AUTO_CREATE = os.environ.get("CREATE_MISSING_SLEEP_PROPERTIES", "").lower() == "true"
+# DB schemas are cached on disk for this long so repeated runs skip databases.retrieve
+SCHEMA_CACHE_DIR = Path.home() / ".cache" / "garmin-to-notion"
+SCHEMA_CACHE_TTL = 6 * 60 * 60  # seconds
 
 if not NOTION_TOKEN:
     sys.exit("ERROR: NOTION_TOKEN is not set.")
 if not SLEEP_DB_ID:
     sys.exit("ERROR: NOTION_SLEEP_DB_ID is not set.")
 
-notion = Client(auth=NOTION_TOKEN, notion_version=NOTION_VERSION)
+notion = Client(auth=NOTION_TOKEN, notion_version=NOTION_VERSION, client=get_notion_http_client())
 
 # ---------- Notion helpers ----------
-def get_db_props(db_id: str) -> dict:
-    db = notion.databases.retrieve(db_id)
-    return db.get("properties", {})
+def _schema_cache_path(db_id: str) -> Path:
+    return SCHEMA_CACHE_DIR / f"schema-{db_id}.json"
 
-# notion_helpers.py
-from typing import Optional, Dict, Tuple
-from notion_client import Client, APIResponseError
-
-# Simple in-process cache
-_DS_CACHE: Dict[str, Tuple[str, str]] = {}
-
-def get_data_source_id(
-    client: Client,
-    database_id: str,
-    prefer_name: Optional[str] = None
-) -> str:
-    """
-    Resolve the data_source_id for a given Notion database (container).
-    Optionally pick a data source by name. Caches the result.
-    """
-    cached = _DS_CACHE.get(database_id)
-    if cached and (prefer_name is None or cached[1] == prefer_name):
-        return cached[0]
+@lru_cache(maxsize=16)
+def get_db_props(db_id: str) -> dict:
+    """Database properties, cached in-process and on disk (see SCHEMA_CACHE_TTL)."""
+    path = _schema_cache_path(db_id)
+    try:
+        if time.time() - path.stat().st_mtime < SCHEMA_CACHE_TTL:
+            return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pass  # missing or unreadable cache -> fetch from Notion
 
+    db = notion.databases.retrieve(db_id)
+    props = db.get("properties", {})
     try:
-        # In Notion 2025-09-03, databases.retrieve returns a container
-        # object that includes a 'data_sources' array (id + name).
-        db = client.databases.retrieve(database_id=database_id)
-    except APIResponseError as e:
-        raise RuntimeError(
-            "Could not retrieve the database container from Notion. "
-            "Check that the ID is a *database* ID (from the DB page URL), "
-            "not a page/view/link ID, and that the database is shared with your integration."
-        ) from e
-
-    data_sources = db.get("data_sources") or []
-    if not data_sources:
-        raise RuntimeError(
-            "No data sources found (or no permission). Make sure this is the ORIGINAL database "
-            "(not a linked view) and that your integration is added via ⋯ → Connections."
-        )
+        SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(props), encoding="utf-8")
+    except OSError:
+        pass  # caching is best effort
+    return props
+
+def invalidate_db_props(db_id: str):
+    """Drop the cached schema (in-process and on disk) so the next call re-fetches it."""
+    get_db_props.cache_clear()
+    try:
+        _schema_cache_path(db_id).unlink()
+    except OSError:
+        pass
 
-    chosen = None
-    if prefer_name:
-        for ds in data_sources:
-            if ds.get("name") == prefer_name:
-                chosen = ds
-                break
-        if not chosen:
-            names = ", ".join(ds.get("name", "〈unnamed〉") for ds in data_sources)
-            raise RuntimeError(f"Data source named '{prefer_name}' not found. Available: {names}")
-    else:
-        chosen = data_sources[0]
-
-    ds_id = chosen["id"]
-    _DS_CACHE[database_id] = (ds_id, chosen.get("name", ""))
-    return ds_id
-
-def find_title_prop(props: dict) -> str:
-    """Find the database's Title property key (often 'Name')."""
+def index_props_by_type(props: dict) -> dict[str, list[str]]:
+    """Group property names by Notion type in one pass, e.g. {'title': ['Name'], 'date': [...]}."""
+    by_type: dict[str, list[str]] = {}
     for key, val in props.items():
-        if val.get("type") == "title":
-            return key
-    return "Name"  # fallback
+        by_type.setdefault(val.get("type"), []).append(key)
+    return by_type
+
+def find_title_prop(by_type: dict) -> str:
+    """Find the database's Title property key (often 'Name')."""
+    return by_type.get("title", ["Name"])[0]  # fallback 'Name'
 
-def find_date_prop(props: dict) -> str | None:
+def find_date_prop(props: dict, by_type: dict) -> str | None:
     """Prefer a Date-typed property literally called 'Date'; otherwise use any Date-typed column."""
-    if "Date" in props and props["Date"].get("type") == "date":
+    if props.get("Date", {}).get("type") == "date":
         return "Date"
-    for key, val in props.items():
-        if val.get("type") == "date":
-            return key
-    return None
+    return by_type.get("date", [None])[0]
 
 def query_by_date(db_id: str, date_prop: str, date_iso: str) -> str | None:
     res = notion.databases.query(
@@ -111,13 +93,22 @@ def query_by_date(db_id: str, date_prop: str, date_iso: str) -> str | None:
     items = res.get("results", [])
     return items[0]["id"] if items else None
 
-def ensure_sleep_schema(db_id: str, props: dict):
-    """Optionally add standard sleep properties so future updates succeed without manual edits."""
-    if not AUTO_CREATE:
-        return
-    notion.databases.update(db_id, properties=props)
+def ensure_sleep_schema(db_id: str, props: dict, existing: dict) -> bool:
+    """
+    Optionally add standard sleep properties so future updates succeed without manual edits.
+    Only properties missing from `existing` are sent; returns True if the schema changed.
+    """
+    missing = {name: spec for name, spec in props.items() if name not in existing}
+    if not AUTO_CREATE or not missing:
+        return False
+    notion.databases.update(db_id, properties=missing)
+    invalidate_db_props(db_id)  # schema changed; next read must see the new columns
+    return True
 
 # ---------- Garmin helpers ----------
+# Field names Garmin has used for the nightly HRV average, in order of preference
+HRV_KEYS = ("lastNightAvg", "avg", "hrvValue", "average")
+
 def to_minutes(seconds):
     return round((seconds or 0) / 60)
 
@@ -131,7 +122,7 @@ def to_iso_z(dt_str):
     return s + "Z"
 
 # ---------- Main ----------
-def main():
+def main(garmin=None):
     # Use the "night of" yesterday in UK time (typical for sleep data)
     target_dt = (datetime.now(TZ) - timedelta(days=1)).date()
     target_str = target_dt.strftime("%Y-%m-%d")
@@ -139,9 +130,7 @@ def main():
 
     # Inspect DB schema
     db_props = get_db_props(SLEEP_DB_ID)
-    title_prop = find_title_prop(db_props)
-    date_prop = find_date_prop(db_props)
-    if not date_prop:
+    if not find_date_prop(db_props, index_props_by_type(db_props)):
         sys.exit(
             "ERROR: No Date property found in your Sleep database.\n"
             "Add a Date column (e.g., 'Date') of type Date in Notion,\n"
@@ -162,11 +151,13 @@ def main():
         "Wake time": {"date": {}},
         "HRV (ms)": {"number": {"format": "number"}},
     }
-    ensure_sleep_schema(SLEEP_DB_ID, standard_props)
+    if ensure_sleep_schema(SLEEP_DB_ID, standard_props, db_props):
+        db_props = get_db_props(SLEEP_DB_ID)
 
     # Garmin login (OAuth via Garth; tokens reused from ~/.garminconnect when available)
-    client = Garmin(os.environ.get("GARMIN_EMAIL", ""), os.environ.get("GARMIN_PASSWORD", ""))
-    client.login()
+    client = garmin
+    if client is None:
+        client = login_garmin(os.environ.get("GARMIN_EMAIL", ""), os.environ.get("GARMIN_PASSWORD", ""))
 
     # Fetch sleep & HRV for the target date
     sleep = client.get_sleep_data(target_str) or {}
@@ -188,54 +179,68 @@ def main():
     waketime_iso = to_iso_z(daily.get("sleepEndTimestampGMT") or daily.get("endTimeGMT"))
 
     # HRV nightly average (best effort; devices vary)
-    hrv_nightly = None
-    if isinstance(hrv, dict):
-        if isinstance(hrv.get("hrvSummary"), dict):
-            for k in ("lastNightAvg", "avg", "average"):
-                v = hrv["hrvSummary"].get(k)
-                if isinstance(v, (int, float)):
-                    hrv_nightly = round(v, 2)
-                    break
-        else:
-            for k in ("lastNightAvg", "avg", "hrvValue", "average"):
-                v = hrv.get(k)
-                if isinstance(v, (int, float)):
-                    hrv_nightly = round(v, 2)
-                    break
+    hrv_src = hrv if isinstance(hrv, dict) else {}
+    if isinstance(hrv_src.get("hrvSummary"), dict):
+        hrv_src = hrv_src["hrvSummary"]
+    hrv_nightly = next(
+        (round(hrv_src[k], 2) for k in HRV_KEYS if isinstance(hrv_src.get(k), (int, float))),
+        None,
+    )
 
     # Only write properties that exist in the DB (prevents 400s)
-    def has_prop(name: str) -> bool:
-        return name in db_props
-
-    props = {date_prop: {"date": {"start": target_str}}}
-    if has_prop("Total (min)"):    props["Total (min)"]    = {"number": total_min}
-    if has_prop("Deep (min)"):     props["Deep (min)"]     = {"number": deep_min}
-    if has_prop("REM (min)"):      props["REM (min)"]      = {"number": rem_min}
-    if has_prop("Light (min)"):    props["Light (min)"]    = {"number": light_min}
-    if has_prop("Awake (min)"):    props["Awake (min)"]    = {"number": awake_min}
-    if has_prop("Score") and score is not None:
+    present = db_props.keys()
+
+    props = {}
+    if "Total (min)" in present: props["Total (min)"] = {"number": total_min}
+    if "Deep (min)" in present:  props["Deep (min)"]  = {"number": deep_min}
+    if "REM (min)" in present:   props["REM (min)"]   = {"number": rem_min}
+    if "Light (min)" in present: props["Light (min)"] = {"number": light_min}
+    if "Awake (min)" in present: props["Awake (min)"] = {"number": awake_min}
+    if "Score" in present and score is not None:
         props["Score"] = {"number": float(score)}
-    if has_prop("Efficiency (%)") and efficiency is not None:
+    if "Efficiency (%)" in present and efficiency is not None:
         props["Efficiency (%)"] = {"number": float(efficiency)}
-    if has_prop("Bedtime") and bedtime_iso:
+    if "Bedtime" in present and bedtime_iso:
         props["Bedtime"] = {"date": {"start": bedtime_iso}}
-    if has_prop("Wake time") and waketime_iso:
+    if "Wake time" in present and waketime_iso:
         props["Wake time"] = {"date": {"start": waketime_iso}}
-    if has_prop("HRV (ms)") and hrv_nightly is not None:
+    if "HRV (ms)" in present and hrv_nightly is not None:
         props["HRV (ms)"] = {"number": float(hrv_nightly)}
 
-    # Upsert (update if exists, otherwise create)
-    page_id = query_by_date(SLEEP_DB_ID, date_prop, target_str)
-    if page_id:
-        notion.pages.update(page_id=page_id, properties=props)
-        print(f"[sleep] Updated page {page_id} for {target_str}")
-    else:
-        new_page = notion.pages.create(
-            parent={"database_id": SLEEP_DB_ID},
-            properties={title_prop: {"title": [{"text": {"content": title}}]}} | props,
-            icon={"emoji": "😴"},
-        )
-        print(f"[sleep] Created page {new_page['id']} for {target_str}")
+    # Upsert (update if exists, otherwise create) against the given schema
+    def upsert(db_props: dict):
+        by_type = index_props_by_type(db_props)
+        title_prop = find_title_prop(by_type)
+        date_prop = find_date_prop(db_props, by_type)
+        if not date_prop:
+            sys.exit("ERROR: No Date property found in your Sleep database.")
+        page_props = {date_prop: {"date": {"start": target_str}}}
+        page_props |= {k: v for k, v in props.items() if k in db_props}
+
+        page_id = query_by_date(SLEEP_DB_ID, date_prop, target_str)
+        if page_id:
+            notion.pages.update(page_id=page_id, properties=page_props)
+            print(f"[sleep] Updated page {page_id} for {target_str}")
+        else:
+            new_page = notion.pages.create(
+                parent={"database_id": SLEEP_DB_ID},
+                properties={title_prop: {"title": [{"text": {"content": title}}]}} | page_props,
+                icon={"emoji": "😴"},
+            )
+            print(f"[sleep] Created page {new_page['id']} for {target_str}")
+
+    try:
+        upsert(db_props)
+    except APIResponseError as e:
+        if e.code != "validation_error":
+            raise
+        # Possibly a stale cached schema (column renamed/removed): refresh once and
+        # retry, but only if the schema really changed
+        invalidate_db_props(SLEEP_DB_ID)
+        fresh_props = get_db_props(SLEEP_DB_ID)
+        if fresh_props == db_props:
+            raise
+        upsert(fresh_props)
 
 if __name__ == "__main__":
     main()
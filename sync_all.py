@@ -0,0 +1,53 @@
+# sync_all.py
+# Runs every sync script in one process: one interpreter start, one Garmin
+# login, and one pooled Notion connection (http_session) shared by all of them.
+import importlib.util
+import os
+import sys
+import traceback
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from garmin_auth import login_garmin
+
+ROOT = Path(__file__).resolve().parent
+
+# Same order the workflow used to run them in
+SCRIPTS = [
+    "garmin-activities.py",
+    "personal-records.py",
+    "daily-steps.py",
+    "sleep_data.py",
+    "health_metrics_all.py",
+]
+
+def load_script(filename: str):
+    """Import a sync script by path (several file names contain '-')."""
+    name = Path(filename).stem.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, ROOT / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main():
+    load_dotenv()
+
+    garmin = login_garmin(os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD"))
+
+    failed = []
+    for filename in SCRIPTS:
+        print(f"[sync] Running {filename}")
+        try:
+            load_script(filename).main(garmin=garmin)
+        except (Exception, SystemExit) as e:
+            # Scripts exit on missing config; keep going so one DB doesn't block the rest
+            print(f"[sync] {filename} failed:", repr(e))
+            traceback.print_exc()
+            failed.append(filename)
+
+    if failed:
+        sys.exit(f"Sync failed: {', '.join(failed)}")  # non-zero so GitHub Actions marks the job as failed
+
+if __name__ == "__main__":
+    main()